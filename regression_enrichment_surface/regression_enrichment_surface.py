@@ -1,40 +1,93 @@
 """Main module."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import matplotlib.pyplot as plt
 import numpy as np
 
+try:
+    from scipy.integrate import simpson as _simps
+except ImportError:  # scipy < 1.6
+    from scipy.integrate import simps as _simps
+
+
+_GRID_CACHE = {}
 
-def erf(x_pred, x_true, r, y, indexs_pred, indexs_true):
-    return len(
-        set(indexs_pred[:int(r * indexs_pred.shape[0])]).intersection(set(indexs_true[:int(y * indexs_pred.shape[0])])))
 
+def _grid(points_, min_sample):
+    key = (points_, min_sample)
+    if key not in _GRID_CACHE:
+        xs = np.logspace(min_sample, 0, points_, base=10)
+        xx, yy = np.meshgrid(xs, xs)
+        for a in (xs, xx, yy):
+            a.setflags(write=False)
+        _GRID_CACHE[key] = xs, xx, yy
+    return _GRID_CACHE[key]
 
-def erfmax(x_pred, x_true, r, y, indexs_pred, indexs_true):
-    return (int(min(r, y) * indexs_pred.shape[0]))
 
+def _has_ties(sorted_a):
+    if np.any(sorted_a[1:] == sorted_a[:-1]):
+        return True
+    # NaNs sort last
+    return (np.issubdtype(sorted_a.dtype, np.floating)
+            and bool(np.isnan(sorted_a[-1:]).any()))
 
-def nefr(*i):
-    return erf(*i) / erfmax(*i)
 
+def _argsort(a):
+    a = np.asarray(a)
+    if _has_ties(np.sort(a[::max(a.shape[0] // 1024, 1)])):
+        return np.argsort(a, kind='stable')
+    order = np.argsort(a)
+    if _has_ties(a[order]):
+        order = np.argsort(a, kind='stable')
+    return order
 
-def nefrcurve(points_, p, t, min_sample=-3, reverse_sort=False):
-    xs = np.logspace(min_sample, 0, points_, base=10)
-    ys = np.logspace(min_sample, 0, points_, base=10)
 
-    indexs_pred = np.argsort(p)
-    indexs_true = np.argsort(t)
+def nefrcurve(points_, p, t, min_sample=-3, reverse_sort=False,
+              indexs_pred=None, indexs_true=None):
+    xs, xx, yy = _grid(points_, min_sample)
+
+    if indexs_pred is None:
+        indexs_pred = _argsort(p)
+    if indexs_true is None:
+        indexs_true = _argsort(t)
+    indexs_pred = np.asarray(indexs_pred)
+    indexs_true = np.asarray(indexs_true)
     if reverse_sort:
         indexs_pred = indexs_pred[::-1]
         indexs_true = indexs_true[::-1]
 
-    xx, yy = np.meshgrid(xs, ys)
-    zz = np.zeros(xx.shape)
-    for i in range(points_):
-        for j in range(points_):
-            zz[i, j] = nefr(p, t, xx[i, j], yy[i, j], indexs_pred, indexs_true)
+    n = indexs_pred.shape[0]
+    k = (xs * n).astype(np.intp)
+    if k[0] == 0:
+        raise ZeroDivisionError("cutoff selects no samples")
+
+    # first cutoff that includes each sample; points_ means never included
+    bin_dtype = np.min_scalar_type((points_ + 1) ** 2)
+    bins = np.repeat(np.arange(points_ + 1, dtype=bin_dtype),
+                     np.diff(k, prepend=0, append=n))
+    pred_bin = np.empty(n, dtype=bin_dtype)
+    pred_bin[indexs_pred] = bins
+    hist = np.bincount(bins * (points_ + 1) + pred_bin[indexs_true],
+                       minlength=(points_ + 1) ** 2)
+    hist = hist.reshape(points_ + 1, points_ + 1)
+    counts = hist.cumsum(axis=0).cumsum(axis=1)[:points_, :points_]
+
+    zz = counts / np.minimum.outer(k, k)
 
     return xx, yy, zz
 
 
+_SIMPS_WEIGHTS = {}
+
+
+def _simps_weights(x):
+    key = x.tobytes()
+    if key not in _SIMPS_WEIGHTS:
+        _SIMPS_WEIGHTS[key] = _simps(np.eye(x.shape[0]), x=x)
+    return _SIMPS_WEIGHTS[key]
+
+
 class RegressionEnrichmentSurface:
 
     def __init__(self, percent_min=-3):
@@ -42,7 +95,7 @@ class RegressionEnrichmentSurface:
         self.nefr = None
         self.stratify = False
 
-    def compute(self, trues, preds, stratify=None, samples=30):
+    def compute(self, trues, preds, stratify=None, samples=30, n_jobs=None):
         self.stratify = stratify is not None
         self.samples = samples
         if not self.stratify:
@@ -50,14 +103,43 @@ class RegressionEnrichmentSurface:
         else:
             x, y, z = [], [], []
             u, indices = np.unique(stratify, return_inverse=True)
-            for i in (range(u.shape[0])):
-                locs = np.argwhere(indices == i).flatten()
-                preds_strat = preds[locs]
-                trues_strat = trues[locs]
+            indices = indices.astype(np.min_scalar_type(u.shape[0]))
+            group = np.argsort(indices, kind='stable')
+            bounds = np.searchsorted(indices[group],
+                                     np.arange(u.shape[0] + 1))
+            local = np.empty(indices.shape[0], dtype=np.intp)
+            local[group] = (np.arange(indices.shape[0])
+                            - np.repeat(bounds[:-1], np.diff(bounds)))
+            order_pred = _argsort(preds)
+            order_true = _argsort(trues)
+            order_pred = order_pred[
+                np.argsort(indices[order_pred], kind='stable')]
+            order_true = order_true[
+                np.argsort(indices[order_true], kind='stable')]
+
+            def stratum_curve(i):
+                start, stop = bounds[i], bounds[i + 1]
                 try:
-                    x_2, y_2, z_2 = nefrcurve(samples, preds_strat, trues_strat)
+                    return nefrcurve(samples, None, None,
+                                     indexs_pred=local[order_pred[start:stop]],
+                                     indexs_true=local[order_true[start:stop]])
                 except ZeroDivisionError:
+                    return None
+
+            if n_jobs is None:
+                n_jobs = 1
+            elif n_jobs < 0:
+                n_jobs = max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+            if n_jobs == 1 or u.shape[0] == 1:
+                curves = [stratum_curve(i) for i in range(u.shape[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                    curves = list(executor.map(stratum_curve,
+                                               range(u.shape[0])))
+            for curve in curves:
+                if curve is None:
                     continue
+                x_2, y_2, z_2 = curve
                 x.append(x_2)
                 y.append(y_2)
                 z.append(z_2)
@@ -66,7 +148,6 @@ class RegressionEnrichmentSurface:
         return self.nefr
 
     def compute_integral(self, uselog=True):
-        import scipy.integrate
         assert not self.stratify  # not implemented yet
 
         X, Y, Z = self.nefr[0], self.nefr[1], self.nefr[2]
@@ -75,25 +156,37 @@ class RegressionEnrichmentSurface:
             X = np.log(X[0, :self.samples].flatten())
             Y /= np.abs(Y.min())
             X /= np.abs(X.min())
-
-        result = scipy.integrate.simps(scipy.integrate.simps(Z, Y), X)
+            result = Z.dot(_simps_weights(Y)).dot(_simps_weights(X))
+        else:
+            result = _simps(_simps(Z, x=Y), x=X)
         return result
 
-    def plot(self, save_file=None, levels=10, title="RES", cmap='Blues', figsize=(8, 5)):
+    def plot(self, save_file=None, levels=10, title="RES", cmap='Blues',
+             figsize=(8, 5), fast=False, isolines=False):
+        if self.stratify:
+            X, Y = self.nefr[0][0], self.nefr[1][0]
+            Z = np.stack(self.nefr[2]).mean(0)
+        else:
+            X, Y, Z = self.nefr
+
         plt.figure(figsize=figsize)
         plt.xscale("log")
         plt.yscale("log")
         plt.xlabel("Screen top x%")
         plt.ylabel("True top x%")
-        plt.contourf(np.stack(self.nefr[0]).mean(0) if self.stratify else self.nefr[0],
-                     np.stack(self.nefr[1]).mean(0) if self.stratify else self.nefr[1],
-                     np.stack(self.nefr[2]).mean(0) if self.stratify else self.nefr[2],
-                     vmin=0,
-                     vmax=1,
-                     cmap=cmap,
-                     levels=levels)
-
+        if fast:
+            plt.pcolormesh(X, Y, Z, vmin=0, vmax=1, cmap=cmap,
+                           shading='nearest')
+        else:
+            plt.contourf(X, Y, Z,
+                         vmin=0,
+                         vmax=1,
+                         cmap=cmap,
+                         levels=levels)
         plt.colorbar()
+        if isolines:
+            plt.contour(X, Y, Z, levels=levels, colors='k', linewidths=0.3)
+
         plt.title(title)
 
         if save_file is None:
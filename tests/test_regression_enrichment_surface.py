@@ -3,19 +3,163 @@
 """Tests for `regression_enrichment_surface` package."""
 
 
+import os
+import tempfile
 import unittest
 
+import matplotlib.pyplot as plt
+import numpy as np
+
 from regression_enrichment_surface import regression_enrichment_surface
 
 
+def erf(r, y, indexs_pred, indexs_true):
+    return len(
+        set(indexs_pred[:int(r * indexs_pred.shape[0])]).intersection(set(indexs_true[:int(y * indexs_pred.shape[0])])))
+
+
+def erfmax(r, y, indexs_pred):
+    return int(min(r, y) * indexs_pred.shape[0])
+
+
+def reference_nefrcurve(points_, p, t, min_sample=-3, reverse_sort=False):
+    xs = np.logspace(min_sample, 0, points_, base=10)
+    indexs_pred = np.argsort(p, kind='stable')
+    indexs_true = np.argsort(t, kind='stable')
+    if reverse_sort:
+        indexs_pred = indexs_pred[::-1]
+        indexs_true = indexs_true[::-1]
+
+    xx, yy = np.meshgrid(xs, xs)
+    zz = np.zeros(xx.shape)
+    for i in range(points_):
+        for j in range(points_):
+            zz[i, j] = erf(xx[i, j], yy[i, j], indexs_pred, indexs_true) / erfmax(xx[i, j], yy[i, j], indexs_pred)
+    return xx, yy, zz
+
+
 class TestRegression_enrichment_surface(unittest.TestCase):
     """Tests for `regression_enrichment_surface` package."""
 
     def setUp(self):
         """Set up test fixtures, if any."""
+        rng = np.random.RandomState(0)
+        self.trues = rng.normal(size=2000)
+        self.preds = self.trues + rng.normal(size=2000)
 
     def tearDown(self):
         """Tear down test fixtures, if any."""
 
     def test_000_something(self):
         """Test something."""
+
+    def test_001_nefrcurve_matches_reference(self):
+        """Test nefrcurve against the set-intersection definition."""
+        for points_ in (5, 12, 30):
+            for min_sample in (-3, -2, -1):
+                for reverse_sort in (False, True):
+                    expected = reference_nefrcurve(points_, self.preds, self.trues, min_sample, reverse_sort)
+                    result = regression_enrichment_surface.nefrcurve(points_, self.preds, self.trues,
+                                                                     min_sample, reverse_sort)
+                    for e, r in zip(expected, result):
+                        np.testing.assert_allclose(r, e)
+
+    def test_002_nefrcurve_empty_cutoff(self):
+        """Test that a cutoff selecting no samples raises ZeroDivisionError."""
+        with self.assertRaises(ZeroDivisionError):
+            regression_enrichment_surface.nefrcurve(10, self.preds[:500], self.trues[:500], -3)
+        with self.assertRaises(ZeroDivisionError):
+            reference_nefrcurve(10, self.preds[:500], self.trues[:500], -3)
+
+    def test_003_stratified_matches_per_stratum(self):
+        """Test stratified compute against nefrcurve on each stratum, with ties."""
+        rng = np.random.RandomState(1)
+        trues = np.round(rng.normal(size=6000), 1)
+        preds = np.round(trues + rng.normal(size=6000), 1)
+        stratify = rng.randint(0, 3, size=6000)
+        stratify[:10] = 7
+
+        res = regression_enrichment_surface.RegressionEnrichmentSurface()
+        x, y, z = res.compute(trues, preds, stratify=stratify)
+
+        self.assertEqual(len(z), 3)
+        for label, zz in zip(range(3), z):
+            mask = stratify == label
+            _, _, expected = reference_nefrcurve(30, preds[mask], trues[mask])
+            np.testing.assert_allclose(zz, expected)
+
+    def test_004_compute_integral(self):
+        """Test compute_integral against nested Simpson integration."""
+        res = regression_enrichment_surface.RegressionEnrichmentSurface()
+        xx, yy, zz = res.compute(self.trues, self.preds)
+
+        ys = np.log(yy[:, 0])
+        xs = np.log(xx[0, :])
+        ys /= np.abs(ys.min())
+        xs /= np.abs(xs.min())
+        simps = regression_enrichment_surface._simps
+        expected = simps(simps(zz, x=ys), x=xs)
+
+        self.assertAlmostEqual(res.compute_integral(), expected)
+        self.assertAlmostEqual(res.compute_integral(), expected)
+
+    def test_005_stratified_n_jobs(self):
+        """Test that threaded stratified compute matches the serial one."""
+        stratify = np.repeat([0, 1], 1000)
+        serial = regression_enrichment_surface.RegressionEnrichmentSurface()
+        expected = serial.compute(self.trues, self.preds, stratify=stratify,
+                                  n_jobs=1)
+
+        for n_jobs in (None, 2, -1, -2):
+            res = regression_enrichment_surface.RegressionEnrichmentSurface()
+            result = res.compute(self.trues, self.preds, stratify=stratify,
+                                 n_jobs=n_jobs)
+            for e, r in zip(expected, result):
+                self.assertEqual(len(r), 2)
+                for e_, r_ in zip(e, r):
+                    np.testing.assert_array_equal(r_, e_)
+
+    def test_006_argsort_matches_stable(self):
+        """Test _argsort against a stable argsort, including ties and NaNs."""
+        rng = np.random.RandomState(3)
+        tie_free = rng.normal(size=4096)
+        # the probe samples every 4th value; put the ties and NaNs elsewhere
+        unprobed = np.arange(4096) % 4 != 0
+        probe_missed = 100 + np.arange(4096, dtype=float)
+        probe_missed[unprobed] = np.round(rng.normal(size=3072), 1)
+        one_nan = rng.normal(size=4096)
+        one_nan[1] = np.nan
+        many_nan = rng.normal(size=4096)
+        many_nan[1::8] = np.nan
+
+        for a in (tie_free, probe_missed, one_nan, many_nan):
+            np.testing.assert_array_equal(
+                regression_enrichment_surface._argsort(a),
+                np.argsort(a, kind='stable'))
+
+    def test_007_plot(self):
+        """Test plot saves stratified and non-stratified surfaces."""
+        plt.switch_backend('Agg')
+        stratify = np.repeat([0, 1], 1000)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for strata in (None, stratify):
+                res = regression_enrichment_surface.RegressionEnrichmentSurface()
+                res.compute(self.trues, self.preds, stratify=strata)
+                for fast in (False, True):
+                    for isolines in (False, True):
+                        save_file = os.path.join(tmpdir, 'res.png')
+                        res.plot(save_file=save_file, fast=fast,
+                                 isolines=isolines)
+                        plt.close('all')
+                        self.assertGreater(os.path.getsize(save_file), 0)
+                        os.remove(save_file)
+
+    def test_008_simpson_import(self):
+        """Test the module-level Simpson integrator used by compute_integral."""
+        import scipy.integrate
+
+        simps = regression_enrichment_surface._simps
+        if hasattr(scipy.integrate, 'simpson'):
+            self.assertIs(simps, scipy.integrate.simpson)
+        xs = np.logspace(-3, 0, 31)
+        self.assertAlmostEqual(simps(xs ** 2, x=xs), (1 - 1e-9) / 3)